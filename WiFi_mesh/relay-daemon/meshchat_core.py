@@ -0,0 +1,186 @@
+"""
+Shared pieces of the BitChat WiFi Mesh test clients (meshchat.py and
+meshchat_listen.py): relay framing, the proof-of-work handshake, and the
+BitchatPacket encoder/decoder.
+"""
+
+import asyncio, ssl, struct, hashlib, time, os, itertools, multiprocessing, threading
+from collections import deque
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+PEER_ID = b"pctest01"  # 8 bytes
+POW_CHUNK = 1 << 16  # candidates per _pow_search call
+# Below these difficulties a process pool costs more than it saves. Forked
+# workers start in milliseconds; forkserver/spawn workers take ~0.5 s.
+POW_PARALLEL_DIFFICULTY = 18
+POW_PARALLEL_DIFFICULTY_NOFORK = 20
+
+# Precompiled wire formats: frame header, and big-endian integers.
+_HDR = struct.Struct("!BI")
+_U16 = struct.Struct("!H")
+_U64 = struct.Struct("!Q")
+# BitchatPacket fixed header + sender ID: version, type, TTL, timestamp,
+# flags, payload length (u16 in v1, u32 in v2), sender ID.
+_PKT_V1 = struct.Struct("!BBBQBH8s")
+_PKT_V2 = struct.Struct("!BBBQBI8s")
+
+PACKET_TYPES = {1: "ANNOUNCE", 2: "MESSAGE", 3: "LEAVE", 0x10: "NOISE_HS", 0x11: "NOISE_ENC"}
+
+def write_frame(writer, ftype, payload=b""):
+    buf = bytearray(5 + len(payload))
+    _HDR.pack_into(buf, 0, ftype, len(payload))
+    buf[5:] = payload
+    writer.write(buf)
+
+def pack_frames(frames):
+    """Pack several (type, payload) frames back-to-back into one buffer."""
+    buf = bytearray(sum(5 + len(payload) for _, payload in frames))
+    pos = 0
+    for ftype, payload in frames:
+        _HDR.pack_into(buf, pos, ftype, len(payload))
+        pos += 5
+        buf[pos:pos + len(payload)] = payload
+        pos += len(payload)
+    return buf
+
+async def read_frame(reader):
+    ftype, length = _HDR.unpack(await reader.readexactly(5))
+    return ftype, await reader.readexactly(length)
+
+def pow_target(difficulty):
+    """Largest SHA-256 digest with `difficulty` leading zero bits."""
+    return ((1 << (256 - difficulty)) - 1).to_bytes(32, "big")
+
+def _pow_search(nonce, target, start, count):
+    """Try solutions in [start, start+count); return the first hit or None."""
+    # The nonce prefix never changes, so hash it once and clone that
+    # state for each candidate instead of re-feeding all 40 bytes.
+    copy = hashlib.sha256(nonce).copy
+    pack = _U64.pack
+    # Digests are big-endian numbers of equal length, so `digest <= target`
+    # is the whole leading-zero test, done as a single memcmp.
+    for sol in range(start, start + count):
+        ctx = copy()
+        ctx.update(pack(sol))
+        if ctx.digest() <= target:
+            return sol
+    return None
+
+def solve_pow(nonce, difficulty, workers=None):
+    """Find the smallest solution for the challenge, using one worker
+    process per core once the difficulty is high enough to pay for it."""
+    target = pow_target(difficulty)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    # Forking is only safe while this is the sole thread. asyncio resolves
+    # hostnames on executor threads, so after connecting to a hostname the
+    # pool has to start workers the slow way instead.
+    methods = multiprocessing.get_all_start_methods()
+    if "fork" in methods and threading.active_count() == 1:
+        method, cutoff = "fork", POW_PARALLEL_DIFFICULTY
+    else:
+        method = "forkserver" if "forkserver" in methods else "spawn"
+        cutoff = POW_PARALLEL_DIFFICULTY_NOFORK
+    if workers < 2 or difficulty < cutoff:
+        for start in itertools.count(0, POW_CHUNK):
+            sol = _pow_search(nonce, target, start, POW_CHUNK)
+            if sol is not None:
+                return sol
+    # Keep two chunks in flight per worker and collect them in submission
+    # order, so the answer matches the serial search. Leaving the with
+    # block terminates workers still busy on later chunks.
+    with multiprocessing.get_context(method).Pool(workers) as pool:
+        pending = deque()
+        for start in itertools.count(0, POW_CHUNK):
+            pending.append(pool.apply_async(_pow_search, (nonce, target, start, POW_CHUNK)))
+            if len(pending) < 2 * workers:
+                continue
+            sol = pending.popleft().get()
+            if sol is not None:
+                return sol
+
+def build_packet(sender_id, message):
+    """Build a v1 BitchatPacket: MESSAGE type"""
+    payload = message.encode("utf-8")
+    ts = int(time.time() * 1000)
+    buf = bytearray(22 + len(payload))
+    buf[0] = 0x01              # version
+    buf[1] = 0x02              # type = MESSAGE
+    buf[2] = 0x07              # TTL = 7
+    _U64.pack_into(buf, 3, ts)  # timestamp (8 bytes)
+    buf[11] = 0x00             # flags
+    _U16.pack_into(buf, 12, len(payload))  # payload length (2 bytes)
+    buf[14:22] = sender_id.ljust(8, b"\x00")[:8]  # senderID (8 bytes)
+    buf[22:] = payload         # payload
+    return buf
+
+def decode_packet(data):
+    """Decode a BitchatPacket and print it."""
+    layout = _PKT_V1 if data and data[0] < 2 else _PKT_V2
+    if len(data) < layout.size:
+        print(f"  [raw {len(data)} bytes]: {data.hex()}", flush=True)
+        return
+    _, msg_type, _, _, flags, plen, sender = layout.unpack_from(data)
+    payload_start = layout.size
+    if flags & 0x01:
+        payload_start += 8
+    payload = data[payload_start:payload_start+plen]
+    tname = PACKET_TYPES.get(msg_type, f"0x{msg_type:02x}")
+    try:
+        text = payload.decode("utf-8")
+    except:
+        text = payload.hex()
+    print(f"  [{tname}] from {sender.hex()}: {text}", flush=True)
+
+async def connect(host, port):
+    """Open the TLS stream to a relay and return (reader, writer)."""
+    # Relay certs are self-signed and unverified, so skip loading the CA store.
+    ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    ctx.check_hostname = False
+    ctx.verify_mode = ssl.CERT_NONE
+    # asyncio enables TCP_NODELAY on TCP transports itself.
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(host, port, ssl=ctx, server_hostname=host), 10)
+    print(f"Connected to {host}:{port}", flush=True)
+    return reader, writer
+
+async def handshake(reader, writer):
+    """HELLO, solve the CHALLENGE, and report whether the relay accepted."""
+    hello = _U16.pack(1) + bytes([len(PEER_ID)]) + PEER_ID
+    write_frame(writer, 0x01, hello)
+
+    ftype, payload = await read_frame(reader)
+    assert ftype == 0x02, f"Expected CHALLENGE, got 0x{ftype:02x}"
+    nonce = payload[:32]
+    difficulty = payload[32]
+    print(f"Solving PoW (difficulty={difficulty})...", flush=True)
+    # Nothing else is scheduled on the loop yet, so solving inline is fine.
+    solution = solve_pow(nonce, difficulty)
+    write_frame(writer, 0x03, _U64.pack(solution))
+
+    ftype, payload = await read_frame(reader)
+    if ftype == 0x04:
+        print("Handshake ACCEPTED!", flush=True)
+        return True
+    print(f"Handshake REJECTED: {payload.decode(errors='replace')}", flush=True)
+    return False
+
+async def close(writer):
+    """Close the relay stream, flushing anything still queued."""
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except (ConnectionError, ssl.SSLError):
+        pass
+
+def run(coro):
+    """Run a client coroutine on uvloop when it is installed."""
+    if uvloop is not None:
+        if hasattr(uvloop, "run"):
+            return uvloop.run(coro)
+        uvloop.install()  # uvloop < 0.18 has no run()
+    return asyncio.run(coro)